@@ -0,0 +1,365 @@
+"""
+Meeting Minutes Generator - Shared Dependencies
+Groq clients, rate limiting and retries used by every router
+"""
+
+# ============================================
+# IMPORTS
+# ============================================
+from contextlib import asynccontextmanager
+import asyncio
+from fastapi import FastAPI
+from typing import Optional
+from groq import AsyncGroq
+import groq
+import httpx
+import os
+import time
+from dotenv import load_dotenv
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception_type, retry_if_not_exception_type, stop_after_attempt, wait_exponential_jitter
+
+# ============================================
+# LOAD ENVIRONMENT VARIABLES
+# ============================================
+load_dotenv()  # Reads .env file and loads variables
+
+# ============================================
+# INITIALIZE GROQ CLIENT
+# ============================================
+# Get API keys from environment
+# GROQ_API_KEYS takes a comma-separated list; GROQ_API_KEY still works for one key
+GROQ_API_KEYS = [key.strip() for key in os.environ.get("GROQ_API_KEYS", "").split(",") if key.strip()]
+if not GROQ_API_KEYS and os.environ.get("GROQ_API_KEY"):
+    GROQ_API_KEYS = [os.environ["GROQ_API_KEY"]]
+
+# Validate at least one API key exists
+if not GROQ_API_KEYS:
+    raise ValueError("❌ GROQ_API_KEY (or GROQ_API_KEYS) not found in environment. Check your .env file!")
+
+# Shared connection pool for all Groq calls
+# Keep-alive connections are reused across requests, so the hot path
+# doesn't pay a new TLS handshake to api.groq.com each time
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=512, max_keepalive_connections=256),
+    http2=True,
+    timeout=httpx.Timeout(connect=5.0, read=60.0, write=60.0, pool=5.0)
+)
+
+# Create one async Groq client per API key, all sharing the pool
+# Awaiting Groq keeps the event loop free for other requests while
+# Whisper and the LLM are working
+# SDK retries are off (max_retries=0); groq_retry below owns retries
+groq_clients = [
+    AsyncGroq(api_key=key, http_client=http_client, max_retries=0)
+    for key in GROQ_API_KEYS
+]
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+# Groq call retries
+GROQ_MAX_ATTEMPTS = 3               # Total tries for retryable Groq errors
+GROQ_RETRY_MAX_WAIT_SECONDS = 8.0   # Longest pause between tries
+
+# Groq account rate limits (kept just under the free-tier caps)
+GROQ_ACCOUNT_RPM = 28               # Groq RPM cap (per API key)
+GROQ_ACCOUNT_TPM = 5800             # Groq TPM cap (per API key)
+
+# Each uvicorn worker keeps its own buckets, so the caps are split between workers
+# Note: a client on one kept-alive connection only ever reaches one worker,
+# so it gets just that worker's share
+UVICORN_WORKERS = max(1, int(os.environ.get("UVICORN_WORKERS", "1")))
+
+# Validate every worker can get at least one request per minute
+# (rounding up to 1 would let the workers together exceed the cap)
+if UVICORN_WORKERS > GROQ_ACCOUNT_RPM:
+    raise ValueError(
+        f"❌ UVICORN_WORKERS={UVICORN_WORKERS} is more than the Groq cap of {GROQ_ACCOUNT_RPM} "
+        f"requests per minute per key. Use at most {GROQ_ACCOUNT_RPM} workers!"
+    )
+
+GROQ_REQUESTS_PER_MINUTE = GROQ_ACCOUNT_RPM // UVICORN_WORKERS  # Per-worker share of the RPM cap
+GROQ_TOKENS_PER_MINUTE = GROQ_ACCOUNT_TPM // UVICORN_WORKERS    # Per-worker share of the TPM cap
+GROQ_KEY_COOLDOWN_SECONDS = 10.0    # Skip a rate-limited key this long if Groq gives no Retry-After
+GROQ_MAX_QUEUE_SECONDS = 20.0       # Longest wait for a key's buckets (well below the frontend's 60s timeout)
+
+# Connection pre-warm
+GROQ_PREWARM_URL = "https://api.groq.com/openai/v1/models"  # Cheap authenticated GET
+GROQ_PREWARM_TIMEOUT_SECONDS = 5.0  # Give up on a pre-warm probe after this long
+
+# ============================================
+# RATE LIMITING & RETRIES
+# ============================================
+
+class GroqQueueTimeout(groq.RateLimitError):
+    """
+    Raised when a call waits too long for a key's rate-limit buckets
+    
+    A RateLimitError, so routes answer it with their usual 503, but it is
+    never retried: the client would have given up before a retry finished
+    """
+    
+    def __init__(self):
+        super().__init__(
+            f"No Groq rate limit capacity within {GROQ_MAX_QUEUE_SECONDS:.0f}s",
+            response=httpx.Response(429, request=httpx.Request("POST", GROQ_PREWARM_URL)),
+            body=None
+        )
+
+class GroqKey:
+    """
+    One Groq API key: its client, rate-limit buckets and current load
+    
+    Note: buckets and counters are per process, so each uvicorn worker
+    keeps its own
+    """
+    
+    def __init__(self, client: AsyncGroq):
+        self.client = client
+        self.rpm = AsyncLimiter(GROQ_REQUESTS_PER_MINUTE, 60)
+        self.tpm = AsyncLimiter(GROQ_TOKENS_PER_MINUTE, 60)
+        self.queued = 0                 # Calls waiting for this key's buckets
+        self.inflight = 0               # Calls currently waiting on Groq
+        self.tpm_used = 0.0             # Recent tokens, draining at the TPM rate
+        self.cool_until = 0.0           # Skip this key until then (after a 429)
+        self._last_drain = time.monotonic()
+    
+    def load(self) -> float:
+        """
+        Current load: queued and in-flight calls plus the fraction of TPM in use
+        
+        Queued calls count too, so a burst spreads across keys instead of
+        piling up behind the one that looked idle when it started
+        """
+        now = time.monotonic()
+        drained = (now - self._last_drain) * GROQ_TOKENS_PER_MINUTE / 60
+        self.tpm_used = max(0.0, self.tpm_used - drained)
+        self._last_drain = now
+        return self.queued + self.inflight + self.tpm_used / GROQ_TOKENS_PER_MINUTE
+    
+    def has_capacity(self, tokens: int) -> bool:
+        """
+        Check whether a call could start on this key right now, without waiting
+        
+        Args:
+            tokens: Estimated tokens the call will use
+        """
+        tokens = min(tokens, GROQ_TOKENS_PER_MINUTE)
+        return self.queued == 0 and self.rpm.has_capacity() and self.tpm.has_capacity(tokens)
+    
+    async def acquire(self, tokens: int):
+        """
+        Wait until this key's RPM and TPM buckets allow one more call
+        
+        Args:
+            tokens: Estimated tokens the call will use
+        
+        Raises:
+            GroqQueueTimeout: Buckets still full after GROQ_MAX_QUEUE_SECONDS
+        """
+        # A single call can't reserve more than the whole bucket
+        tokens = min(tokens, GROQ_TOKENS_PER_MINUTE)
+        
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._acquire_buckets(tokens), GROQ_MAX_QUEUE_SECONDS)
+        except asyncio.TimeoutError:
+            # Give up rather than spend quota on a call the client stopped waiting for
+            raise GroqQueueTimeout()
+        finally:
+            self.queued -= 1
+        
+        self.load()
+        self.tpm_used += tokens
+    
+    async def _acquire_buckets(self, tokens: int):
+        """
+        Wait on the RPM bucket, then the TPM bucket
+        """
+        await self.rpm.acquire()
+        await self.tpm.acquire(tokens)
+    
+    def cool_down(self, seconds: float):
+        """
+        Stop routing calls to this key for a while after a 429
+        """
+        self.cool_until = time.monotonic() + seconds
+
+groq_keys = [GroqKey(client) for client in groq_clients]
+
+def pick_groq_key(tokens: int) -> GroqKey:
+    """
+    Pick an API key for a call that isn't cooling down after a 429
+    
+    Prefers the least-loaded key whose buckets can take the call right
+    now; if none can, the least-backlogged key is used and the call waits
+    there. If every key is cooling down, the one that recovers first is used
+    
+    Args:
+        tokens: Estimated tokens the call will use
+    """
+    now = time.monotonic()
+    ready = [key for key in groq_keys if key.cool_until <= now]
+    if not ready:
+        return min(groq_keys, key=lambda key: key.cool_until)
+    
+    free = [key for key in ready if key.has_capacity(tokens)]
+    return min(free or ready, key=lambda key: key.load())
+
+def retry_after_seconds(error: groq.RateLimitError) -> Optional[float]:
+    """
+    Read the Retry-After header (in seconds) from a Groq 429, if present
+    """
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class HeldStream:
+    """
+    Groq chunk stream that keeps its API key counted as in flight
+    
+    The slot is released when the stream is closed, not when it opens,
+    so a key serving a long SSE response isn't picked as idle meanwhile
+    """
+    
+    def __init__(self, stream, key: GroqKey):
+        self.stream = stream
+        self.key = key
+    
+    def __aiter__(self):
+        return self.stream.__aiter__()
+    
+    async def close(self):
+        """
+        Close the Groq stream and release the key's in-flight slot (once)
+        """
+        if self.key is not None:
+            self.key.inflight -= 1
+            self.key = None
+        await self.stream.close()
+
+async def call_groq(tokens: int, make_call, stream: bool = False):
+    """
+    Run one Groq call on the least-loaded API key
+    
+    Args:
+        tokens: Estimated tokens the call will use
+        make_call: Function taking an AsyncGroq client and returning the
+                   call's coroutine
+        stream: True if the call returns a chunk stream; the key then stays
+                in flight until the stream is closed
+    
+    Returns:
+        Whatever the Groq call returns (a HeldStream when stream=True)
+    """
+    key = pick_groq_key(tokens)
+    await key.acquire(tokens)
+    
+    key.inflight += 1
+    handed_off = False
+    try:
+        result = await make_call(key.client)
+        if stream:
+            handed_off = True   # HeldStream.close() releases the slot
+            return HeldStream(result, key)
+        return result
+    except groq.RateLimitError as e:
+        retry_after = retry_after_seconds(e)
+        key.cool_down(GROQ_KEY_COOLDOWN_SECONDS if retry_after is None else retry_after)
+        raise
+    finally:
+        if not handed_off:
+            key.inflight -= 1
+
+_exponential_backoff = wait_exponential_jitter(initial=0.5, max=GROQ_RETRY_MAX_WAIT_SECONDS)
+
+def wait_for_retry_after(retry_state) -> float:
+    """
+    Pick how long to wait before retrying a Groq call
+    
+    On rate limits, retries straight away if another API key is free,
+    else uses Groq's Retry-After header (capped). Other errors back off
+    exponentially with jitter
+    
+    Args:
+        retry_state: tenacity RetryCallState for the failed attempt
+    
+    Returns:
+        float: Seconds to wait
+    """
+    error = retry_state.outcome.exception()
+    if isinstance(error, groq.RateLimitError):
+        now = time.monotonic()
+        if any(key.cool_until <= now for key in groq_keys):
+            return 0.0
+        
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, GROQ_RETRY_MAX_WAIT_SECONDS)
+    return _exponential_backoff(retry_state)
+
+# Retry policy for transient Groq failures (429s, 5xx, dropped connections, timeouts)
+# Queue timeouts are not retried: the local buckets are still full
+groq_retry = retry(
+    retry=retry_if_exception_type((
+        groq.RateLimitError,
+        groq.APIConnectionError,
+        groq.InternalServerError,
+        httpx.TimeoutException
+    )) & retry_if_not_exception_type(GroqQueueTimeout),
+    wait=wait_for_retry_after,
+    stop=stop_after_attempt(GROQ_MAX_ATTEMPTS),
+    reraise=True
+)
+
+# ============================================
+# APP LIFESPAN
+# ============================================
+
+# Startup pre-warm tasks, kept so they aren't garbage collected mid-flight
+prewarm_tasks = set()
+
+async def prewarm_groq_connection(api_key: str):
+    """
+    Open a connection to api.groq.com before the first real request
+    
+    The first user no longer pays the DNS + TCP + TLS handshake. Failures
+    are only logged; the first real call will connect on its own
+    
+    Args:
+        api_key: Groq API key to authenticate the probe with
+    """
+    try:
+        response = await http_client.get(
+            GROQ_PREWARM_URL,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=GROQ_PREWARM_TIMEOUT_SECONDS
+        )
+        if response.status_code != 200:
+            print(f"⚠️ Groq pre-warm got HTTP {response.status_code}")
+    except httpx.HTTPError as e:
+        print(f"⚠️ Groq pre-warm failed: {e!r}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Share the Groq clients for the app's lifetime
+    
+    The clients above are created once per process at import, so every
+    router uses the same connection pool; it's closed when the server stops.
+    On startup the pool is pre-warmed in the background, one probe per
+    API key, without holding up the server
+    """
+    for key in GROQ_API_KEYS:
+        task = asyncio.create_task(prewarm_groq_connection(key))
+        prewarm_tasks.add(task)
+        task.add_done_callback(prewarm_tasks.discard)
+    
+    yield
+    
+    for task in prewarm_tasks:
+        task.cancel()
+    await http_client.aclose()
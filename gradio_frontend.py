@@ -4,8 +4,16 @@ Connects to FastAPI backend for transcription and minutes generation
 """
 
 import gradio as gr
-import requests
-from typing import Optional, Tuple
+import httpx
+import aiofiles
+import orjson
+import asyncio
+import atexit
+import hashlib
+import mimetypes
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Optional, Tuple
 import os
 
 # ============================================
@@ -18,42 +26,121 @@ API_BASE_URL = "http://localhost:8001"
 # Maximum file size (25MB in bytes)
 MAX_FILE_SIZE_BYTES = 25 * 1024 * 1024
 
+# Chunk size for reading audio files from disk (64KB)
+READ_CHUNK_SIZE = 64 * 1024
+
+# Minimum new characters before pushing streamed minutes to the UI,
+# so the websocket isn't flooded with one update per token
+STREAM_UPDATE_CHARS = 64
+
+# Connection pool size for the shared backend client
+MAX_BACKEND_CONNECTIONS = 8
+
+# Clicks processed at once. Each click can hold two connections
+# (health check + transcription), so this keeps them within the pool
+GENERATE_CONCURRENCY_LIMIT = MAX_BACKEND_CONNECTIONS // 2
+
+# ============================================
+# Status Messages
+# ============================================
+
+_TRANSCRIBING_TMPL = "🎙️ **Transcribing audio...** ({size}MB)\n\n*Think of your favourite song in the meanwhile 🎵*"
+_TRANSCRIBED_TMPL = "✅ **Transcription complete!**\n\n📝 Preview: *{preview}*"
+_GENERATING_MSG = "📝 **Generating minutes...**\n\n*Think of your favourite TV Show in the meanwhile 📺*"
+_DONE_TMPL = "✅ **All done!** Minutes generated successfully.\n\n📄 **File:** {filename} ({size}MB)"
+
+# ============================================
+# Shared HTTP Client
+# ============================================
+
+# One async client for all backend calls, so requests don't block the
+# Gradio event loop and connections are reused between clicks.
+# The pool keeps a few keep-alive connections to the backend warm so the
+# health check, transcription and minutes calls share them
+_client = httpx.AsyncClient(
+    base_url=API_BASE_URL,
+    timeout=httpx.Timeout(120.0),
+    limits=httpx.Limits(max_connections=MAX_BACKEND_CONNECTIONS, max_keepalive_connections=4)
+)
+
+def _close_client():
+    """
+    Close the shared HTTP client when the frontend exits
+    """
+    try:
+        asyncio.run(_client.aclose())
+    except RuntimeError:
+        pass
+
+atexit.register(_close_client)
+
+# ============================================
+# Result Caches
+# ============================================
+
+# Transcripts keyed by a hash of the audio bytes, so clicking Generate
+# twice on the same recording doesn't re-run Whisper
+_TRANSCRIBE_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_TRANSCRIBE_CACHE_MAX = 32
+
+# Minutes keyed by a hash of the transcript, so a repeated transcript
+# doesn't pay for another LLM call
+_MINUTES_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_MINUTES_CACHE_MAX = 32
+_MINUTES_CACHE_STATS = {"hits": 0, "misses": 0}
+
+# Last successful health check, reused for a few seconds so rapid
+# clicks don't each probe the backend
+_HEALTH_CACHE = {"ts": 0.0, "ok": False}
+_HEALTH_CACHE_TTL_SECONDS = 5.0
+
 # ============================================
 # Helper Functions
 # ============================================
 
-def check_backend_health() -> bool:
+async def check_backend_health() -> bool:
     """
     Check if FastAPI backend is running
     
     Returns:
         bool: True if backend is healthy, False otherwise
     """
+    # Only healthy results are cached, so a backend that was just started
+    # is picked up on the next click
+    if _HEALTH_CACHE["ok"] and time.monotonic() - _HEALTH_CACHE["ts"] < _HEALTH_CACHE_TTL_SECONDS:
+        return True
+    
     try:
-        response = requests.get(f"{API_BASE_URL}/", timeout=2)
-        return response.status_code == 200
-    except:
-        return False
+        response = await _client.get("/", timeout=2)
+        ok = response.status_code == 200
+    except httpx.HTTPError:
+        ok = False
+    
+    _HEALTH_CACHE["ts"] = time.monotonic()
+    _HEALTH_CACHE["ok"] = ok
+    return ok
 
-def get_file_size_mb(file_path: str) -> float:
+async def hash_file(file_path: str) -> str:
     """
-    Get file size in megabytes
+    Hash a file's contents without loading it all into memory
     
     Args:
         file_path: Path to file
     
     Returns:
-        float: File size in MB
+        str: Hex digest of the file contents
     """
-    size_bytes = os.path.getsize(file_path)
-    size_mb = size_bytes / (1024 * 1024)
-    return round(size_mb, 2)
+    hasher = hashlib.blake2b(digest_size=16)
+    async with aiofiles.open(file_path, "rb") as f:
+        while chunk := await f.read(READ_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
 # ============================================
 # API Communication Functions
 # ============================================
 
-def call_transcribe_api(audio_path: str) -> Tuple[Optional[str], Optional[str]]:
+async def call_transcribe_api(audio_path: str) -> Tuple[Optional[str], Optional[str]]:
     """
     Call /transcribe endpoint to convert audio to text
     
@@ -64,111 +151,181 @@ def call_transcribe_api(audio_path: str) -> Tuple[Optional[str], Optional[str]]:
         tuple: (transcript_text, error_message)
     """
     try:
+        # Return cached transcript if this exact audio was seen before
+        cache_key = await hash_file(audio_path)
+        if cache_key in _TRANSCRIBE_CACHE:
+            _TRANSCRIBE_CACHE.move_to_end(cache_key)
+            return _TRANSCRIBE_CACHE[cache_key], None
+        
+        # Pass the open file so httpx streams it in chunks instead of
+        # holding the whole recording in memory
+        filename = os.path.basename(audio_path)
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
         with open(audio_path, "rb") as audio_file:
-            files = {"file": audio_file}
-            
-            response = requests.post(
-                f"{API_BASE_URL}/transcribe",
-                files=files,
-                timeout=120
+            response = await _client.post(
+                "/transcribe",
+                files={"file": (filename, audio_file, content_type)}
             )
         
         if response.status_code == 200:
-            data = response.json()
-            return data["transcript"], None
+            transcript = orjson.loads(response.content)["transcript"]
+            
+            _TRANSCRIBE_CACHE[cache_key] = transcript
+            _TRANSCRIBE_CACHE.move_to_end(cache_key)
+            if len(_TRANSCRIBE_CACHE) > _TRANSCRIBE_CACHE_MAX:
+                _TRANSCRIBE_CACHE.popitem(last=False)
+            
+            return transcript, None
         else:
             try:
-                error_detail = response.json().get("detail", "Unknown error")
-            except:
+                error_detail = orjson.loads(response.content).get("detail", "Unknown error")
+            except (orjson.JSONDecodeError, AttributeError):
                 error_detail = f"HTTP {response.status_code}"
             
             return None, f"Transcription failed: {error_detail}"
     
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         return None, "❌ Cannot connect to backend. Is the server running on port 8001?"
     
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         return None, "❌ Request timed out. The audio file might be too long."
     
     except Exception as e:
         return None, f"❌ Error: {str(e)}"
 
-def call_generate_minutes_api(transcript: str) -> Tuple[Optional[str], Optional[str]]:
+async def call_generate_minutes_api(transcript: str) -> AsyncIterator[Tuple[Optional[str], Optional[str]]]:
     """
     Call /generate-minutes endpoint to convert transcript to formatted minutes
     
+    The backend streams the minutes as Server-Sent Events while they are
+    generated, so this yields the partial Markdown as it grows and the
+    complete minutes last
+    
     Args:
         transcript: Raw transcript text
     
-    Returns:
-        tuple: (minutes_markdown, error_message)
+    Yields:
+        tuple: (minutes_markdown_so_far, error_message)
     """
+    # Return cached minutes if this exact transcript was seen before
+    cache_key = hashlib.blake2b(transcript.encode(), digest_size=16).hexdigest()
+    if cache_key in _MINUTES_CACHE:
+        _MINUTES_CACHE.move_to_end(cache_key)
+        _MINUTES_CACHE_STATS["hits"] += 1
+        print(f"📦 Minutes cache hit ({_MINUTES_CACHE_STATS['hits']} hits / {_MINUTES_CACHE_STATS['misses']} misses)")
+        yield _MINUTES_CACHE[cache_key], None
+        return
+    
+    _MINUTES_CACHE_STATS["misses"] += 1
+    print(f"📦 Minutes cache miss ({_MINUTES_CACHE_STATS['hits']} hits / {_MINUTES_CACHE_STATS['misses']} misses)")
+    
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/generate-minutes",
+        async with _client.stream(
+            "POST",
+            "/generate-minutes",
             json={"transcript": transcript},
             timeout=60
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data["minutes"], None
-        else:
-            try:
-                error_detail = response.json().get("detail", "Unknown error")
-            except:
-                error_detail = f"HTTP {response.status_code}"
+        ) as response:
             
-            return None, f"Minutes generation failed: {error_detail}"
+            if response.status_code != 200:
+                await response.aread()
+                try:
+                    error_detail = orjson.loads(response.content).get("detail", "Unknown error")
+                except (orjson.JSONDecodeError, AttributeError):
+                    error_detail = f"HTTP {response.status_code}"
+                
+                yield None, f"Minutes generation failed: {error_detail}"
+                return
+            
+            buf = ""
+            last_sent = 0
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                
+                event = orjson.loads(line[6:])
+                if "error" in event:
+                    yield None, event["error"]
+                    return
+                
+                buf += event.get("delta", "")
+                if len(buf) - last_sent >= STREAM_UPDATE_CHARS:
+                    last_sent = len(buf)
+                    yield buf, None
+        
+        minutes = buf.strip()
+        if not minutes:
+            yield None, "Minutes generation failed: LLM returned empty response. Please try again."
+            return
+        
+        _MINUTES_CACHE[cache_key] = minutes
+        _MINUTES_CACHE.move_to_end(cache_key)
+        if len(_MINUTES_CACHE) > _MINUTES_CACHE_MAX:
+            _MINUTES_CACHE.popitem(last=False)
+        
+        yield minutes, None
     
-    except requests.exceptions.ConnectionError:
-        return None, "❌ Cannot connect to backend. Is the server running on port 8001?"
+    except httpx.ConnectError:
+        yield None, "❌ Cannot connect to backend. Is the server running on port 8001?"
     
-    except requests.exceptions.Timeout:
-        return None, "❌ Request timed out. Please try again."
+    except httpx.TimeoutException:
+        yield None, "❌ Request timed out. Please try again."
     
     except Exception as e:
-        return None, f"❌ Error: {str(e)}"
+        yield None, f"❌ Error: {str(e)}"
 
 # ============================================
 # Main Processing Function
 # ============================================
 
-def process_audio_to_minutes(audio_path: str) -> Tuple[str, str, gr.update]:
+async def process_audio_to_minutes(audio_path: str):
     """
     Main function: Convert audio file to formatted meeting minutes
     
     Args:
         audio_path: Path to uploaded audio file
     
-    Returns:
+    Yields:
         tuple: (status_message, minutes_markdown, accordion_update)
     """
     
     # Validate input
     if not audio_path:
-        return "❌ Please upload an audio file first.", "", gr.update(open=False)
-    
-    # Check backend health
-    if not check_backend_health():
-        return "❌ Backend server is not running! Please start it with: python backend.py", "", gr.update(open=False)
+        yield "❌ Please upload an audio file first.", "", gr.update(open=False)
+        return
     
     # Get file info
     try:
-        file_size_mb = get_file_size_mb(audio_path)
+        file_size_bytes = os.stat(audio_path).st_size
         filename = os.path.basename(audio_path)
-    except Exception as e:
-        return f"❌ Error reading file: {str(e)}", "", gr.update(open=False)
+    except OSError as e:
+        yield f"❌ Error reading file: {str(e)}", "", gr.update(open=False)
+        return
+    
+    file_size_mb = round(file_size_bytes / (1024 * 1024), 2)
     
     # Check file size
-    if file_size_mb > 25:
-        return f"❌ File too large ({file_size_mb}MB). Maximum size is 25MB.", "", gr.update(open=False)
+    if file_size_bytes > MAX_FILE_SIZE_BYTES:
+        yield f"❌ File too large ({file_size_mb}MB). Maximum size is 25MB.", "", gr.update(open=False)
+        return
     
     # STEP 1: Transcribe
-    status_msg = f"🎙️ **Transcribing audio...** ({file_size_mb}MB)\n\n*Think of your favourite song in the meanwhile 🎵*"
-    yield status_msg, "", gr.update(open=False)
+    yield _TRANSCRIBING_TMPL.format(size=file_size_mb), "", gr.update(open=False)
+    
+    # Start the upload right away and check backend health alongside it,
+    # instead of paying for the health round trip before any real work
+    health_task = asyncio.create_task(check_backend_health())
+    transcribe_task = asyncio.create_task(call_transcribe_api(audio_path))
     
-    transcript, error = call_transcribe_api(audio_path)
+    done, _ = await asyncio.wait({health_task}, timeout=2)
+    
+    if health_task not in done or not health_task.result():
+        health_task.cancel()
+        transcribe_task.cancel()
+        yield "❌ Backend server is not running! Please start it with: python backend.py", "", gr.update(open=False)
+        return
+    
+    transcript, error = await transcribe_task
     
     if error:
         yield f"❌ {error}", "", gr.update(open=False)
@@ -176,22 +333,25 @@ def process_audio_to_minutes(audio_path: str) -> Tuple[str, str, gr.update]:
     
     # Show transcript preview
     transcript_preview = transcript[:150] + "..." if len(transcript) > 150 else transcript
-    status_msg = f"✅ **Transcription complete!**\n\n📝 Preview: *{transcript_preview}*"
-    yield status_msg, "", gr.update(open=False)
+    yield _TRANSCRIBED_TMPL.format(preview=transcript_preview), "", gr.update(open=False)
     
     # STEP 2: Generate minutes
-    status_msg = "📝 **Generating minutes...**\n\n*Think of your favourite TV Show in the meanwhile 📺*"
-    yield status_msg, "", gr.update(open=False)
-    
-    minutes, error = call_generate_minutes_api(transcript)
-    
-    if error:
-        yield f"❌ {error}", "", gr.update(open=False)
-        return
+    yield _GENERATING_MSG, "", gr.update(open=False)
+    
+    # Show minutes as they stream in; status and accordion are left
+    # untouched after the first chunk so only the minutes are re-sent
+    minutes = ""
+    accordion_update = gr.update(open=True)
+    async for minutes, error in call_generate_minutes_api(transcript):
+        if error:
+            yield f"❌ {error}", "", gr.update(open=False)
+            return
+        
+        yield gr.update(), minutes, accordion_update
+        accordion_update = gr.update()
     
     # Final result
-    final_status = f"✅ **All done!** Minutes generated successfully.\n\n📄 **File:** {filename} ({file_size_mb}MB)"
-    yield final_status, minutes, gr.update(open=True)
+    yield _DONE_TMPL.format(filename=filename, size=file_size_mb), minutes, gr.update(open=True)
 
 def refresh_page():
     """
@@ -324,7 +484,8 @@ with gr.Blocks(title="Meeting Minutes Generator", theme=gr.themes.Soft()) as dem
     generate_btn.click(
         fn=process_audio_to_minutes,
         inputs=[audio_input],
-        outputs=[status_output, minutes_output, minutes_accordion]
+        outputs=[status_output, minutes_output, minutes_accordion],
+        concurrency_limit=GENERATE_CONCURRENCY_LIMIT  # Gradio defaults to one click at a time
     )
     
     # Refresh button
@@ -6,17 +6,42 @@ Handles audio transcription and minutes generation using Groq
 # ============================================
 # IMPORTS
 # ============================================
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
-from groq import Groq
+from collections.abc import Mapping
+import groq
+import httpx
+import orjson
 import os
-from dotenv import load_dotenv
+from cachetools import LRUCache
+import hashlib
+from deps import (
+    GROQ_REQUESTS_PER_MINUTE, GROQ_TOKENS_PER_MINUTE, UVICORN_WORKERS,
+    call_groq, groq_retry, lifespan
+)
+from transcription import UploadSizeLimitMiddleware, router as transcribe_router
 
 # ============================================
-# LOAD ENVIRONMENT VARIABLES
+# MIDDLEWARE
 # ============================================
-load_dotenv()  # Reads .env file and loads variables
+
+class NoStreamGZipMiddleware(GZipMiddleware):
+    """
+    Gzip responses over minimum_size, except the /generate-minutes SSE stream
+    
+    Stream frames are small and must reach the client as soon as they're
+    sent, so they're passed through untouched
+    """
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/generate-minutes":
+            await self.app(scope, receive, send)
+            return
+        
+        await super().__call__(scope, receive, send)
 
 # ============================================
 # INITIALIZE FASTAPI APP
@@ -24,35 +49,24 @@ load_dotenv()  # Reads .env file and loads variables
 app = FastAPI(
     title="Meeting Minutes API",
     version="2.0.0",
-    description="Transcribe meeting audio and generate formatted minutes using Groq"
+    description="Transcribe meeting audio and generate formatted minutes using Groq",
+    default_response_class=ORJSONResponse,  # orjson encodes responses faster than stdlib json
+    lifespan=lifespan  # Shares the Groq clients and closes them on shutdown
 )
 
-# ============================================
-# INITIALIZE GROQ CLIENT
-# ============================================
-# Get API key from environment
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+# Upload size check runs before the multipart body is received
+app.add_middleware(UploadSizeLimitMiddleware)
 
-# Validate API key exists
-if not GROQ_API_KEY:
-    raise ValueError("❌ GROQ_API_KEY not found in environment. Check your .env file!")
+# Transcripts and minutes are plain prose, so they compress well
+app.add_middleware(NoStreamGZipMiddleware, minimum_size=1024, compresslevel=6)
 
-# Create Groq client
-groq_client = Groq(api_key=GROQ_API_KEY)
+# /transcribe lives in transcription.py
+app.include_router(transcribe_router)
 
 # ============================================
 # PYDANTIC MODELS (Type Safety & Documentation)
 # ============================================
 
-class TranscribeResponse(BaseModel):
-    """
-    Response model for successful transcription
-    """
-    transcript: str          # The transcribed text
-    file_size_mb: float      # Size of uploaded file in MB
-    filename: str            # Original filename
-    success: bool            # Always True for successful responses
-
 class GenerateMinutesRequest(BaseModel):
     """
     Request model for generating minutes
@@ -65,28 +79,20 @@ class GenerateMinutesResponse(BaseModel):
     """
     minutes: str            # Formatted Markdown minutes
     success: bool           # Always True for successful responses
-
-class ErrorResponse(BaseModel):
-    """
-    Response model for errors
-    """
-    error: str              # Error message
-    detail: Optional[str]   # Additional error details
+    cached_tokens: Optional[int] = None  # Prompt tokens Groq served from its prompt cache
 
 # ============================================
 # CONSTANTS
 # ============================================
 
-# Transcription settings
-MAX_FILE_SIZE_MB = 25              # Groq Whisper limit
-WHISPER_MODEL = "whisper-large-v3"  # Most accurate Whisper model
-WHISPER_TEMPERATURE = 0.1           # Slight randomness for better transcription
-
 # Minutes generation settings
 LLM_MODEL = "openai/gpt-oss-120b"   # Groq LLM model for minutes
 LLM_TEMPERATURE = 0.1               # Low temperature for consistent, factual output
 MAX_COMPLETION_TOKENS = 1024        # Enough for any realistic meeting minutes
 
+# Groq call timeouts
+LLM_TIMEOUT_SECONDS = 60.0          # Max wait per LLM call
+
 # System prompt for minutes generation
 MINUTES_SYSTEM_PROMPT = """You are an assistant that converts meeting transcripts into concise, factual minutes.
 
@@ -121,27 +127,209 @@ Use this exact structure:
 ### **Notes** [minimum 3 sentences]
 - Short factual notes or clarifications.
 
-Be concise, professional, and factually grounded. Maintain Markdown formatting faithfully."""
+Be concise, professional, and factually grounded. Maintain Markdown formatting faithfully.
+
+The user message is the raw meeting transcript. Convert it into structured minutes."""
+
+# Bump whenever MINUTES_SYSTEM_PROMPT (or how messages are built) changes,
+# so cached minutes from the old prompt are never served.
+# Keep the prompt byte-identical otherwise: Groq caches the shared prefix
+MINUTES_PROMPT_VERSION = 2
+
+# System message built once and shared by every request
+MINUTES_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": MINUTES_SYSTEM_PROMPT
+}
+
+# Minutes cache settings
+MINUTES_CACHE_SIZE = 512            # Max generated minutes kept in memory
 
 # ============================================
 # HELPER FUNCTIONS
 # ============================================
 
-def check_file_size(file_bytes: bytes) -> tuple[bool, float]:
+# Generated minutes keyed by model + prompt version + transcript, so
+# "regenerate" clicks and client retries skip the LLM
+# Note: per process, so each uvicorn worker keeps its own cache
+minutes_cache = LRUCache(maxsize=MINUTES_CACHE_SIZE)
+
+def minutes_cache_key(transcript: str) -> bytes:
+    """
+    Build the minutes cache key for a transcript
+    
+    Args:
+        transcript: Raw transcript text
+    
+    Returns:
+        bytes: SHA-256 digest of model, prompt version and transcript
+    """
+    return hashlib.sha256(f"{LLM_MODEL}|{MINUTES_PROMPT_VERSION}|{transcript}".encode()).digest()
+
+@groq_retry
+async def chat_with_groq(messages: list, stream: bool):
+    """
+    Send messages to Groq LLM, retrying transient failures
+    
+    For streams, only opening the stream is retried
+    
+    Args:
+        messages: Chat messages (system prompt + user transcript)
+        stream: True to get an async stream of chunks
+    
+    Returns:
+        Groq chat completion, or chunk stream when stream=True
+    """
+    # Roughly 4 characters per prompt token, plus the completion budget
+    prompt_chars = sum(len(message["content"]) for message in messages)
+    
+    return await call_groq(
+        prompt_chars // 4 + MAX_COMPLETION_TOKENS,
+        lambda client: client.chat.completions.create(
+            model=LLM_MODEL,                      # openai/gpt-oss-120b
+            messages=messages,                     # System prompt + user transcript
+            temperature=LLM_TEMPERATURE,           # 0.1 for deterministic output
+            max_completion_tokens=MAX_COMPLETION_TOKENS,  # 1024 tokens max
+            top_p=1,                              # Standard sampling
+            stream=stream,                        # Stream tokens or get complete response
+            stop=None,                            # No custom stop sequences
+            timeout=LLM_TIMEOUT_SECONDS           # Don't let a hung socket hold the worker
+        ),
+        stream=stream                             # Keep the key in flight until the stream closes
+    )
+
+async def create_minutes_completion(transcript: str, stream: bool):
+    """
+    Call Groq LLM to turn a transcript into Markdown minutes
+    
+    Args:
+        transcript: Raw transcript text
+        stream: True to get an async stream of chunks instead of one completion
+    
+    Returns:
+        Groq chat completion, or chunk stream when stream=True
+    
+    Raises:
+        HTTPException 500: Groq API error
+        HTTPException 503: Groq still rate limiting after retries
+    """
+    # Build messages array for LLM
+    messages = [
+        MINUTES_SYSTEM_MESSAGE,
+        {
+            # Transcript alone, so everything before it is a stable,
+            # cacheable prefix
+            "role": "user",
+            "content": transcript
+        }
+    ]
+    
+    try:
+        # Create chat completion request
+        return await chat_with_groq(messages, stream)
+        
+    except groq.RateLimitError:
+        # Still rate limited after retries - tell the client to back off
+        raise HTTPException(
+            status_code=503,
+            detail="Minutes generation failed: Groq is rate limiting requests. Please try again in a minute."
+        )
+    
+    except groq.APIError as e:
+        # Groq API errors (bad request, server errors, network issues, etc.)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Minutes generation failed: {e.message}. Please try again."
+        )
+    
+    except Exception as e:
+        # Catch any other errors while calling Groq
+        raise HTTPException(
+            status_code=500,
+            detail=f"Minutes generation failed: {str(e)}. Please try again."
+        )
+
+def cached_prompt_tokens(usage) -> Optional[int]:
+    """
+    Read how many prompt tokens Groq served from its prompt cache
+    
+    Args:
+        usage: Usage block from a completion (or x_groq on the last stream chunk)
+    
+    Returns:
+        int or None: Cached prompt tokens, None if Groq didn't report it
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, Mapping):
+        # Not declared by the Groq SDK, so it comes back as a plain dict
+        return details.get("cached_tokens")
+    return getattr(details, "cached_tokens", None)
+
+def sse_event(data: dict) -> bytes:
     """
-    Check if uploaded file is within size limit
+    Format one Server-Sent Events frame
     
     Args:
-        file_bytes: Raw file bytes
+        data: JSON-serializable event payload
     
     Returns:
-        tuple: (is_valid, size_in_mb)
-        - is_valid: True if file is under limit
-        - size_in_mb: Actual file size in megabytes
+        bytes: "data: {...}" frame terminated by a blank line
+    """
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+async def stream_minutes_events(stream, cache_key: bytes):
+    """
+    Turn a Groq chunk stream into Server-Sent Events
+    
+    Each frame is {"delta": "..."} with the next piece of Markdown.
+    If Groq reports usage on the last chunk, a {"cached_tokens": n} frame
+    follows. If Groq fails mid-stream, a final {"error": "..."} frame is
+    sent, since the 200 status has already gone out by then.
+    The Groq stream is always closed, even if the client disconnects.
+    Complete, non-empty minutes are added to the minutes cache
+    
+    Args:
+        stream: Groq chat completion stream (stream=True)
+        cache_key: Minutes cache key for this transcript
+    
+    Yields:
+        bytes: SSE frames
     """
-    size_mb = len(file_bytes) / (1024 * 1024)  # Convert bytes to MB
-    is_valid = size_mb <= MAX_FILE_SIZE_MB
-    return is_valid, size_mb
+    parts = []
+    cached_tokens = None
+    try:
+        async for chunk in stream:
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield sse_event({"delta": delta})
+            
+            # Groq puts usage on the final chunk
+            x_groq = getattr(chunk, "x_groq", None)
+            if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                cached_tokens = cached_prompt_tokens(x_groq.usage)
+    
+    except groq.APIError as e:
+        yield sse_event({"error": f"Minutes generation failed: {e.message}. Please try again."})
+        return
+    
+    except httpx.HTTPError as e:
+        # Network errors while reading the stream (e.g. the read timeout)
+        # come through the SDK as raw httpx exceptions
+        yield sse_event({"error": f"Minutes generation failed: lost connection to Groq ({type(e).__name__}). Please try again."})
+        return
+    
+    finally:
+        # Release the Groq connection, also when the client disconnects
+        await stream.close()
+    
+    if cached_tokens is not None:
+        yield sse_event({"cached_tokens": cached_tokens})
+    
+    minutes_text = "".join(parts).strip()
+    if minutes_text:
+        minutes_cache[cache_key] = minutes_text
 
 # ============================================
 # API ENDPOINTS
@@ -161,119 +349,87 @@ def root():
         "status": "healthy",
         "endpoints": {
             "transcribe": "/transcribe (POST)",
-            "generate_minutes": "/generate-minutes (POST)",
+            "generate_minutes": "/generate-minutes (POST, SSE stream)",
+            "generate_minutes_sync": "/generate-minutes-sync (POST)",
             "health": "/ (GET)"
         }
     }
 
-@app.post("/transcribe", response_model=TranscribeResponse)
-async def transcribe_audio(file: UploadFile = File(...)):
+@app.post("/generate-minutes")
+async def generate_minutes(request: GenerateMinutesRequest):
     """
-    Transcribe audio file to text using Groq Whisper Large v3
+    Generate formatted meeting minutes from raw transcript using Groq LLM
     
     FLOW:
-    1. Receive audio file from client (Gradio UI)
-    2. Read file bytes into memory
-    3. Validate file size (must be < 25MB)
-    4. Send file to Groq Whisper API
-    5. Receive transcript text
-    6. Validate transcript is not empty
-    7. Return transcript with metadata
+    1. Receive raw transcript text
+    2. Validate transcript is not empty
+    3. Return cached minutes if this transcript was seen before
+    4. Open a streaming call to Groq LLM (gpt-oss-120b)
+    5. Stream the Markdown minutes back as Server-Sent Events
     
     Args:
-        file: Uploaded audio file
-              Supported formats: mp3, wav, m4a, webm, flac
+        request: GenerateMinutesRequest containing transcript text
     
     Returns:
-        TranscribeResponse: Contains transcript text and metadata
+        StreamingResponse: text/event-stream of {"delta": ...} frames,
+                           or a final {"error": ...} frame on failure.
+                           X-Cache header is HIT or MISS
     
     Raises:
-        HTTPException 400: File too large or invalid
+        HTTPException 400: Empty transcript
         HTTPException 500: Groq API error
+        HTTPException 503: Groq still rate limiting after retries
     """
     
     # ========================================
-    # STEP 1: Read uploaded file bytes
+    # STEP 1: Validate transcript is not empty
     # ========================================
-    try:
-        file_bytes = await file.read()
-    except Exception as e:
+    # isspace() stops at the first non-space character instead of copying the transcript
+    if not request.transcript or request.transcript.isspace():
         raise HTTPException(
             status_code=400,
-            detail=f"Failed to read uploaded file: {str(e)}"
+            detail="Transcript cannot be empty. Please provide a valid transcript."
         )
     
     # ========================================
-    # STEP 2: Validate file size
+    # STEP 2: Check minutes cache
     # ========================================
-    is_valid_size, size_mb = check_file_size(file_bytes)
+    cache_key = minutes_cache_key(request.transcript)
+    cached_minutes = minutes_cache.get(cache_key)
     
-    if not is_valid_size:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large ({size_mb:.2f}MB). Maximum allowed is {MAX_FILE_SIZE_MB}MB. "
-                   f"Please upload a shorter recording or compress the audio."
+    if cached_minutes is not None:
+        return StreamingResponse(
+            iter([sse_event({"delta": cached_minutes})]),
+            media_type="text/event-stream",
+            headers={"X-Cache": "HIT"}
         )
     
     # ========================================
-    # STEP 3: Call Groq Whisper API
-    # ========================================
-    try:
-        # Create transcription request
-        # Note: file parameter expects tuple of (filename, bytes)
-        transcription = groq_client.audio.transcriptions.create(
-            file=(file.filename, file_bytes),  # Tuple: (name, bytes)
-            model=WHISPER_MODEL,               # whisper-large-v3
-            temperature=WHISPER_TEMPERATURE,    # 0.1 for slightly varied but consistent output
-            response_format="text"             # Returns plain text (not JSON)
-        )
-        
-        # Extract transcript text from response
-        # When response_format="text", the response IS the text string
-        transcript_text = transcription
-        
-    except Exception as e:
-        # Catch any Groq API errors (rate limits, network issues, etc.)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Transcription failed: {str(e)}. Please try again."
-        )
-    
-    # ========================================
-    # STEP 4: Validate transcript is not empty
+    # STEP 3: Call Groq LLM API
     # ========================================
-    if not transcript_text or len(transcript_text.strip()) == 0:
-        raise HTTPException(
-            status_code=400,
-            detail="No speech detected in audio file. Please ensure the recording contains clear speech."
-        )
+    # Opened here (not inside the generator) so connection and auth
+    # errors still surface as a proper HTTP error
+    stream = await create_minutes_completion(request.transcript, stream=True)
     
     # ========================================
-    # STEP 5: Return successful response
+    # STEP 4: Stream minutes back to client
     # ========================================
-    return TranscribeResponse(
-        transcript=transcript_text.strip(),  # Remove leading/trailing whitespace
-        file_size_mb=round(size_mb, 2),      # Round to 2 decimal places
-        filename=file.filename,               # Original filename
-        success=True                          # Success flag
+    return StreamingResponse(
+        stream_minutes_events(stream, cache_key),
+        media_type="text/event-stream",
+        headers={"X-Cache": "MISS"}
     )
 
-@app.post("/generate-minutes", response_model=GenerateMinutesResponse)
-async def generate_minutes(request: GenerateMinutesRequest):
+@app.post("/generate-minutes-sync", response_model=GenerateMinutesResponse)
+async def generate_minutes_sync(request: GenerateMinutesRequest, response: Response):
     """
-    Generate formatted meeting minutes from raw transcript using Groq LLM
+    Generate formatted meeting minutes in a single JSON response
     
-    FLOW:
-    1. Receive raw transcript text
-    2. Validate transcript is not empty
-    3. Build messages array (system prompt + user transcript)
-    4. Call Groq LLM (gpt-oss-120b)
-    5. Receive formatted Markdown minutes
-    6. Validate output is not empty
-    7. Return formatted minutes
+    Same as /generate-minutes, for clients that can't consume SSE
     
     Args:
         request: GenerateMinutesRequest containing transcript text
+        response: Outgoing response, used to set the X-Cache header
     
     Returns:
         GenerateMinutesResponse: Contains formatted Markdown minutes
@@ -281,71 +437,58 @@ async def generate_minutes(request: GenerateMinutesRequest):
     Raises:
         HTTPException 400: Empty transcript
         HTTPException 500: Groq API error
+        HTTPException 503: Groq still rate limiting after retries
     """
     
     # ========================================
     # STEP 1: Validate transcript is not empty
     # ========================================
-    if not request.transcript or len(request.transcript.strip()) == 0:
+    # isspace() stops at the first non-space character instead of copying the transcript
+    if not request.transcript or request.transcript.isspace():
         raise HTTPException(
             status_code=400,
             detail="Transcript cannot be empty. Please provide a valid transcript."
         )
     
     # ========================================
-    # STEP 2: Build messages array for LLM
+    # STEP 2: Check minutes cache
     # ========================================
-    messages = [
-        {
-            "role": "system",
-            "content": MINUTES_SYSTEM_PROMPT
-        },
-        {
-            "role": "user",
-            "content": f"Please convert the following meeting transcript into structured minutes:\n\n{request.transcript}"
-        }
-    ]
+    cache_key = minutes_cache_key(request.transcript)
+    cached_minutes = minutes_cache.get(cache_key)
+    
+    if cached_minutes is not None:
+        response.headers["X-Cache"] = "HIT"
+        return GenerateMinutesResponse(minutes=cached_minutes, success=True)
+    
+    response.headers["X-Cache"] = "MISS"
     
     # ========================================
     # STEP 3: Call Groq LLM API
     # ========================================
-    try:
-        # Create chat completion request
-        completion = groq_client.chat.completions.create(
-            model=LLM_MODEL,                      # openai/gpt-oss-120b
-            messages=messages,                     # System prompt + user transcript
-            temperature=LLM_TEMPERATURE,           # 0.1 for deterministic output
-            max_completion_tokens=MAX_COMPLETION_TOKENS,  # 1024 tokens max
-            top_p=1,                              # Standard sampling
-            stream=False,                         # Get complete response at once
-            stop=None                             # No custom stop sequences
-        )
-        
-        # Extract generated minutes from response
-        minutes_text = completion.choices[0].message.content
-        
-    except Exception as e:
-        # Catch any Groq API errors (rate limits, network issues, etc.)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Minutes generation failed: {str(e)}. Please try again."
-        )
+    completion = await create_minutes_completion(request.transcript, stream=False)
+    
+    # Extract generated minutes from response, stripped once
+    # (minutes are capped at MAX_COMPLETION_TOKENS, so this stays inline)
+    minutes_text = (completion.choices[0].message.content or "").strip()
     
     # ========================================
     # STEP 4: Validate minutes are not empty
     # ========================================
-    if not minutes_text or len(minutes_text.strip()) == 0:
+    if not minutes_text:
         raise HTTPException(
             status_code=500,
             detail="LLM returned empty response. Please try again."
         )
     
     # ========================================
-    # STEP 5: Return successful response
+    # STEP 5: Cache and return successful response
     # ========================================
+    minutes_cache[cache_key] = minutes_text
+    
     return GenerateMinutesResponse(
-        minutes=minutes_text.strip(),  # Remove leading/trailing whitespace
-        success=True                    # Success flag
+        minutes=minutes_text,
+        success=True,                   # Success flag
+        cached_tokens=cached_prompt_tokens(completion.usage)
     )
 
 # ============================================
@@ -360,12 +503,27 @@ if __name__ == "__main__":
     print("🔍 Health check: http://localhost:8000")
     print("\n✅ Available endpoints:")
     print("   POST /transcribe - Convert audio to text")
-    print("   POST /generate-minutes - Convert transcript to formatted minutes")
+    print("   POST /generate-minutes - Stream formatted minutes from a transcript (SSE)")
+    print("   POST /generate-minutes-sync - Convert transcript to formatted minutes")
+    
+    # One worker by default; set UVICORN_WORKERS to opt in to more
+    # Exported so each worker process splits the Groq rate limits the same way
+    # Note: caches and rate limiters are per worker
+    workers = UVICORN_WORKERS
+    os.environ["UVICORN_WORKERS"] = str(workers)
+    
+    if workers > 1:
+        print(f"\n⚠️ Running {workers} workers: each gets 1/{workers} of the Groq rate limits "
+              f"({GROQ_REQUESTS_PER_MINUTE} RPM, {GROQ_TOKENS_PER_MINUTE} TPM per key).")
+        print("   A client on one kept-alive connection (like the Gradio UI) only uses one worker's share.")
     
     # Run the FastAPI app with uvicorn
     uvicorn.run(
-        app,
+        "transcription+minutes:app",    # Import string (required for multiple workers)
         host="0.0.0.0",  # Listen on all network interfaces
-        port=8001,        # Port 8000 (standard for APIs)
+        port=8001,        # Port 8001
+        workers=workers,  # Worker processes
+        loop="auto",      # uvloop when installed (not available on Windows)
+        http="auto",      # httptools when installed
         log_level="info"  # Show request logs
     )
@@ -1,44 +1,25 @@
 """
-Meeting Minutes Generator - Backend API
+Meeting Minutes Generator - Transcription Router
 Handles audio transcription using Groq Whisper Large v3
 """
 
 # ============================================
 # IMPORTS
 # ============================================
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Optional
-from groq import Groq
+import anyio
+import groq
 import os
-from dotenv import load_dotenv
+from cachetools import TTLCache
+import hashlib
+from deps import call_groq, groq_retry
 
 # ============================================
-# LOAD ENVIRONMENT VARIABLES
+# INITIALIZE ROUTER
 # ============================================
-load_dotenv()  # Reads .env file and loads variables
-
-# ============================================
-# INITIALIZE FASTAPI APP
-# ============================================
-app = FastAPI(
-    title="Meeting Minutes API",
-    version="1.0.0",
-    description="Transcribe meeting audio to text using Whisper"
-)
-
-# ============================================
-# INITIALIZE GROQ CLIENT
-# ============================================
-# Get API key from environment
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
-
-# Validate API key exists
-if not GROQ_API_KEY:
-    raise ValueError("❌ GROQ_API_KEY not found in environment. Check your .env file!")
-
-# Create Groq client
-groq_client = Groq(api_key=GROQ_API_KEY)
+router = APIRouter()
 
 # ============================================
 # PYDANTIC MODELS (Type Safety & Documentation)
@@ -52,76 +33,160 @@ class TranscribeResponse(BaseModel):
     file_size_mb: float      # Size of uploaded file in MB
     filename: str            # Original filename
     success: bool            # Always True for successful responses
-
-class ErrorResponse(BaseModel):
-    """
-    Response model for errors
-    """
-    error: str              # Error message
-    detail: Optional[str]   # Additional error details
+    cache_hit: bool = False  # True if served from the transcript cache
 
 # ============================================
 # CONSTANTS
 # ============================================
+
+# Transcription settings
 MAX_FILE_SIZE_MB = 25              # Groq Whisper limit
+MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024  # Same limit in bytes
+MULTIPART_OVERHEAD_BYTES = 64 * 1024  # Allowance for multipart boundaries and part headers
 WHISPER_MODEL = "whisper-large-v3"  # Most accurate Whisper model
-TEMPERATURE = 0.1                   # Slight randomness for better output
+WHISPER_TEMPERATURE = 0.1           # Slight randomness for better transcription
+WHISPER_TIMEOUT_SECONDS = 30.0      # Max wait per Whisper call
+WHISPER_TOKENS_PER_MB = 150         # ~1 minute of audio per MB, counted against TPM
+
+# Transcript cache settings
+TRANSCRIPT_CACHE_SIZE = 1024        # Max transcripts kept in memory
+TRANSCRIPT_CACHE_TTL_SECONDS = 3600 # Forget cached transcripts after an hour
+HASH_CHUNK_SIZE = 1024 * 1024       # Read uploads 1MB at a time when hashing
+STRIP_IN_THREAD_CHARS = 256 * 1024  # Strip longer transcripts off the event loop
 
 # ============================================
 # HELPER FUNCTIONS
 # ============================================
 
-def check_file_size(file_bytes: bytes) -> tuple[bool, float]:
+def check_file_size(size_bytes: int) -> bool:
     """
     Check if uploaded file is within size limit
     
     Args:
-        file_bytes: Raw file bytes
+        size_bytes: File size in bytes
     
     Returns:
-        tuple: (is_valid, size_in_mb)
-        - is_valid: True if file is under limit
-        - size_in_mb: Actual file size in megabytes
+        bool: True if file is under limit
     """
-    size_mb = len(file_bytes) / (1024 * 1024)  # Convert bytes to MB
-    is_valid = size_mb <= MAX_FILE_SIZE_MB
-    return is_valid, size_mb
+    return size_bytes <= MAX_FILE_SIZE_BYTES
+
+# Transcripts keyed by a hash of the audio bytes, so re-sent audio
+# (UI retries, repeated demo clips) skips Whisper entirely
+# Note: per process, so each uvicorn worker keeps its own cache
+transcript_cache = TTLCache(maxsize=TRANSCRIPT_CACHE_SIZE, ttl=TRANSCRIPT_CACHE_TTL_SECONDS)
+
+async def hash_upload(file: UploadFile) -> str:
+    """
+    Hash an uploaded file in chunks, leaving it rewound for the next reader
+    
+    Args:
+        file: Uploaded file
+    
+    Returns:
+        str: Hex digest of the file contents
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    while chunk := await file.read(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    await file.seek(0)
+    return hasher.hexdigest()
+
+async def strip_transcript(text: str) -> str:
+    """
+    Strip leading/trailing whitespace from a transcript
+    
+    Very long transcripts are stripped in a worker thread so the copy
+    doesn't stall the event loop; short ones are stripped inline
+    
+    Args:
+        text: Raw transcript text
+    
+    Returns:
+        str: Stripped transcript
+    """
+    if len(text) > STRIP_IN_THREAD_CHARS:
+        return await anyio.to_thread.run_sync(str.strip, text)
+    return text.strip()
+
+@groq_retry
+async def transcribe_with_groq(filename: str, audio_file, size_mb: float) -> str:
+    """
+    Send audio to Groq Whisper, retrying transient failures
+    
+    Args:
+        filename: Original filename (Groq uses the extension)
+        audio_file: Seekable file object; httpx streams it from the start
+                    on every attempt
+        size_mb: File size in MB, used to estimate rate-limit usage
+    
+    Returns:
+        str: Transcript text
+    """
+    # Note: passing the file object lets httpx stream it to Groq in
+    # chunks instead of copying the whole upload into memory
+    return await call_groq(
+        int(size_mb * WHISPER_TOKENS_PER_MB) + 1,
+        lambda client: client.audio.transcriptions.create(
+            file=(filename, audio_file),       # Tuple: (name, file object)
+            model=WHISPER_MODEL,               # whisper-large-v3
+            temperature=WHISPER_TEMPERATURE,   # 0.1 for slightly varied but consistent output
+            response_format="text",            # Returns plain text (not JSON)
+            timeout=WHISPER_TIMEOUT_SECONDS    # Don't let a hung socket hold the worker
+        )
+    )
 
 # ============================================
-# API ENDPOINTS
+# MIDDLEWARE
 # ============================================
 
-@app.get("/")
-def root():
+class UploadSizeLimitMiddleware:
     """
-    Health check endpoint
+    Reject oversized /transcribe uploads from the Content-Length header,
+    before any of the multipart body is received and spooled
     
-    Returns API status and version info
-    Used to verify backend is running correctly
+    Uploads without a Content-Length (chunked) still get the size check
+    inside transcribe_audio
     """
-    return {
-        "message": "🎙️ Meeting Minutes API is running!",
-        "version": "1.0.0",
-        "status": "healthy",
-        "endpoints": {
-            "transcribe": "/transcribe (POST)",
-            "health": "/ (GET)"
-        }
-    }
-
-@app.post("/transcribe", response_model=TranscribeResponse)
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/transcribe":
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            max_bytes = MAX_FILE_SIZE_BYTES + MULTIPART_OVERHEAD_BYTES
+            
+            if content_length.isdigit() and int(content_length) > max_bytes:
+                size_mb = int(content_length) / (1024 * 1024)
+                response = ORJSONResponse(
+                    status_code=413,
+                    content={
+                        "detail": f"File too large ({size_mb:.2f}MB). Maximum allowed is {MAX_FILE_SIZE_MB}MB. "
+                                  f"Please upload a shorter recording or compress the audio."
+                    }
+                )
+                await response(scope, receive, send)
+                return
+        
+        await self.app(scope, receive, send)
+
+# ============================================
+# API ENDPOINTS
+# ============================================
+
+@router.post("/transcribe", response_model=TranscribeResponse)
 async def transcribe_audio(file: UploadFile = File(...)):
     """
     Transcribe audio file to text using Groq Whisper Large v3
     
     FLOW:
     1. Receive audio file from client (Gradio UI)
-    2. Read file bytes into memory
-    3. Validate file size (must be < 25MB)
-    4. Send file to Groq Whisper API
+    2. Validate file size (must be < 25MB) without reading it
+    3. Return cached transcript if this audio was seen recently
+    4. Stream the uploaded file to Groq Whisper API
     5. Receive transcript text
     6. Validate transcript is not empty
-    7. Return transcript with metadata
+    7. Cache and return transcript with metadata
     
     Args:
         file: Uploaded audio file
@@ -131,15 +196,23 @@ async def transcribe_audio(file: UploadFile = File(...)):
         TranscribeResponse: Contains transcript text and metadata
     
     Raises:
-        HTTPException 400: File too large or invalid
+        HTTPException 400: Invalid file
+        HTTPException 413: File too large
         HTTPException 500: Groq API error
+        HTTPException 503: Groq still rate limiting after retries
     """
     
     # ========================================
-    # STEP 1: Read uploaded file bytes
+    # STEP 1: Get uploaded file size
     # ========================================
+    # Starlette records the size while spooling the upload, so the
+    # bytes never need to be read into memory here
     try:
-        file_bytes = await file.read()
+        size_bytes = file.size
+        if size_bytes is None:
+            # Fallback when the size wasn't recorded: measure the spooled file
+            size_bytes = file.file.seek(0, os.SEEK_END)
+        await file.seek(0)
     except Exception as e:
         raise HTTPException(
             status_code=400,
@@ -149,73 +222,82 @@ async def transcribe_audio(file: UploadFile = File(...)):
     # ========================================
     # STEP 2: Validate file size
     # ========================================
-    is_valid_size, size_mb = check_file_size(file_bytes)
+    size_mb = size_bytes / (1024 * 1024)  # Convert bytes to MB
     
-    if not is_valid_size:
+    if not check_file_size(size_bytes):
         raise HTTPException(
-            status_code=400,
+            status_code=413,
             detail=f"File too large ({size_mb:.2f}MB). Maximum allowed is {MAX_FILE_SIZE_MB}MB. "
                    f"Please upload a shorter recording or compress the audio."
         )
     
     # ========================================
-    # STEP 3: Call Groq Whisper API
+    # STEP 3: Check transcript cache
+    # ========================================
+    cache_key = await hash_upload(file)
+    cached_transcript = transcript_cache.get(cache_key)
+    
+    if cached_transcript is not None:
+        return TranscribeResponse(
+            transcript=cached_transcript,
+            file_size_mb=round(size_mb, 2),
+            filename=file.filename,
+            success=True,
+            cache_hit=True
+        )
+    
+    # ========================================
+    # STEP 4: Call Groq Whisper API
     # ========================================
     try:
         # Create transcription request
-        # Note: file parameter expects tuple of (filename, bytes)
-        transcription = groq_client.audio.transcriptions.create(
-            file=(file.filename, file_bytes),  # Tuple: (name, bytes)
-            model=WHISPER_MODEL,               # whisper-large-v3
-            temperature=TEMPERATURE,            # 0.1 for slightly varied but consistent output
-            response_format="text"             # Returns plain text (not JSON)
-        )
+        transcription = await transcribe_with_groq(file.filename, file.file, size_mb)
         
         # Extract transcript text from response
         # When response_format="text", the response IS the text string
         transcript_text = transcription
         
+    except groq.RateLimitError:
+        # Still rate limited after retries - tell the client to back off
+        raise HTTPException(
+            status_code=503,
+            detail="Transcription failed: Groq is rate limiting requests. Please try again in a minute."
+        )
+    
+    except groq.APIError as e:
+        # Groq API errors (bad request, server errors, network issues, etc.)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Transcription failed: {e.message}. Please try again."
+        )
+    
     except Exception as e:
-        # Catch any Groq API errors (rate limits, network issues, etc.)
+        # Catch any other errors while calling Groq
         raise HTTPException(
             status_code=500,
             detail=f"Transcription failed: {str(e)}. Please try again."
         )
     
     # ========================================
-    # STEP 4: Validate transcript is not empty
+    # STEP 5: Validate transcript is not empty
     # ========================================
-    if not transcript_text or len(transcript_text.strip()) == 0:
+    # Stripped once here and reused below
+    transcript_text = await strip_transcript(transcript_text or "")
+    
+    if not transcript_text:
         raise HTTPException(
             status_code=400,
             detail="No speech detected in audio file. Please ensure the recording contains clear speech."
         )
     
     # ========================================
-    # STEP 5: Return successful response
+    # STEP 6: Cache and return successful response
     # ========================================
+    transcript_cache[cache_key] = transcript_text
+    
     return TranscribeResponse(
-        transcript=transcript_text.strip(),  # Remove leading/trailing whitespace
+        transcript=transcript_text,
         file_size_mb=round(size_mb, 2),      # Round to 2 decimal places
         filename=file.filename,               # Original filename
         success=True                          # Success flag
     )
-
-# ============================================
-# RUN SERVER (for local testing)
-# ============================================
-if __name__ == "__main__":
-    import uvicorn
-    
-    print("🚀 Starting Meeting Minutes Backend...")
-    print("📍 Server will run on: http://localhost:8000")
-    print("📖 API docs available at: http://localhost:8000/docs")
-    print("🔍 Health check: http://localhost:8000")
-    
-    # Run the FastAPI app with uvicorn
-    uvicorn.run(
-        app,
-        host="0.0.0.0",  # Listen on all network interfaces
-        port=8000,        # Port 8000 (standard for APIs)
-        log_level="info"  # Show request logs
-    )